@@ -266,25 +266,23 @@ def where(update, context):
     ask_location(update, context)
 
 
-def get_dynamic_igraph(context):
-    """Returns a dynamic igraph, which is the data structure used to find the paths that the bot 
-    shows to its users.
+def get_dynamic_itimes(context):
+    """Returns the dynamic itimes of the igraph, which are used along with it to find the paths
+    that the bot shows to its users.
 
-    The dynamic igraph is built if it has not been built already, or if it is older than five
-    minutes, since it uses traffic data which is updated every five minutes.
+    The dynamic itimes are computed if they have not been computed already, or if they are older
+    than five minutes, since they use traffic data which is updated every five minutes. They are
+    kept in the bot data, as they are small compared to the igraph.
     """
     if "last_congestions_update" not in context.bot_data or \
         (datetime.now() - context.bot_data["last_congestions_update"]).total_seconds() / 60 >= 5:
         congestions = igo.download_congestions(CONGESTIONS_URL)
-        dynamic_igraph = igo.build_dynamic_igraph(igraph, highway_paths, congestions)
-        igo.save_data(dynamic_igraph, DYNAMIC_IGRAPH_FILENAME)
+        context.bot_data["dynamic_itimes"] = igo.build_dynamic_itimes(igraph, highway_paths, congestions)
 
         # Obtain the last congestions update datetime from the first Congestion (they are all the same).
         context.bot_data["last_congestions_update"] = congestions[1].datetime
-    else:
-        dynamic_igraph = igo.load_data(DYNAMIC_IGRAPH_FILENAME)  # We do not have to check if it exists.
     
-    return dynamic_igraph
+    return context.bot_data["dynamic_itimes"]
 
 
 def get_and_plot_path(update, context):
@@ -306,8 +304,8 @@ def get_and_plot_path(update, context):
     if source == destination:
         context.bot.send_message(chat_id=update.effective_chat.id, text=translate("Oh, you are already here!", lang) + " 🥳")
     else:
-        dynamic_igraph = get_dynamic_igraph(context)
-        ipath = igo.get_ipath(dynamic_igraph, source, destination)
+        dynamic_itimes = get_dynamic_itimes(context)
+        ipath = igo.get_ipath(igraph, source, destination, dynamic_itimes)
         if ipath:
             path_plot = igo.get_ipath_plot(ipath, SIZE)
             send_plot(update, context, path_plot)
@@ -339,10 +337,9 @@ def send_plot(update, context, plot):
 if __name__ == "__main__":
     # Constants.
     PLACE = "Barcelona, Barcelonés, Barcelona, Catalonia"
-    DEFAULT_GRAPH_FILENAME = "graph.dat"
+    DEFAULT_GRAPH_FILENAME = "graph.npz"
     STATIC_IGRAPH_FILENAME = "static_igraph.dat"
-    DYNAMIC_IGRAPH_FILENAME = "dynamic_igraph.dat"
-    HIGHWAYS_FILENAME = "highways.dat"
+    HIGHWAYS_FILENAME = "highway_paths.dat"
     SIZE = 1000
     HIGHWAYS_URL = "https://opendata-ajuntament.barcelona.cat/data/dataset/1090983a-1c40-4609-8620-14ad49aae3ab/resource/" \
                    "1d6c814c-70ef-4147-aa16-a49ddb952f72/download/transit_relacio_trams.csv"
@@ -354,27 +351,27 @@ if __name__ == "__main__":
 
     # Load the default graph, or build it if it does not exist (and save it for later).
     if igo.file_exists(DEFAULT_GRAPH_FILENAME):
-        graph = igo.load_data(DEFAULT_GRAPH_FILENAME)
+        graph = igo.load_graph(DEFAULT_GRAPH_FILENAME)
     else:
         graph = igo.build_default_graph(PLACE)
-        igo.save_data(graph, DEFAULT_GRAPH_FILENAME)
+        igo.save_graph(graph, DEFAULT_GRAPH_FILENAME)
     print("Default graph loaded!")
 
-    # Load the highway paths, or build them if they do not exist (and save them for later).
-    if igo.file_exists(HIGHWAYS_FILENAME):
-        highway_paths = igo.load_data(HIGHWAYS_FILENAME)
-    else:
+    # Load the highway paths, or build them if they do not exist or were built from another graph
+    # (and save them for later).
+    highway_paths = igo.load_graph_data(graph, HIGHWAYS_FILENAME)
+    if highway_paths is None:
         highways = igo.download_highways(HIGHWAYS_URL)
         highway_paths = igo.build_highway_paths(graph, highways)
-        igo.save_data(highway_paths, HIGHWAYS_FILENAME)
+        igo.save_graph_data(highway_paths, graph, HIGHWAYS_FILENAME)
     print("Highway paths loaded!")
 
-    # Load the static igraph, or build it if it does not exist (and save it for later).
-    if igo.file_exists(STATIC_IGRAPH_FILENAME):
-        igraph = igo.load_data(STATIC_IGRAPH_FILENAME)
-    else:
+    # Load the static igraph, or build it if it does not exist or was built from another graph (and
+    # save it for later). It is pickled, because its string inodes make save_graph slower to load.
+    igraph = igo.load_graph_data(graph, STATIC_IGRAPH_FILENAME)
+    if igraph is None:
         igraph = igo.build_static_igraph(graph)
-        igo.save_data(igraph, STATIC_IGRAPH_FILENAME)
+        igo.save_graph_data(igraph, graph, STATIC_IGRAPH_FILENAME)
     print("Static igraph loaded!")
 
     # Read the bot access token from the file 'token.txt'.
@@ -13,22 +13,31 @@ order.
 """
 
 import collections
+import concurrent.futures
 import csv
 from datetime import datetime
+import functools
+import hashlib
+import io
 import math
 import os
 import pickle
 import re
-import statistics
-import urllib
+import threading
+import urllib.request
 
 import networkx
+import numpy
 import osmnx
+import scipy.sparse
+import scipy.sparse.csgraph
+import scipy.spatial
 import shapely.geometry
+import shapely.prepared
 import staticmap
 
 Coordinates = collections.namedtuple("Coordinates", "longitude latitude")
-Highway = collections.namedtuple("Highway", "description coordinates_list")
+Highway = collections.namedtuple("Highway", "description coordinates")
 Congestion = collections.namedtuple("Congestion", "datetime current_state planned_state")
 
 
@@ -41,8 +50,9 @@ def file_exists(filename):
 
 def save_data(data, filename):
     """Saves the object 'data' to a file with the specified filename."""
+    # The highest protocol available has the most compact and fastest binary format.
     with open(filename, "wb") as file:
-        pickle.dump(data, file)
+        pickle.dump(data, file, protocol=pickle.HIGHEST_PROTOCOL)
 
 
 def load_data(filename):
@@ -55,6 +65,153 @@ def load_data(filename):
         return data
 
 
+def get_graph_fingerprint(graph):
+    """Returns a string that identifies the nodes and edges of the graph, so that the data built
+    from a graph (like the highway paths or the static igraph) can be checked to belong to the same
+    graph later, even after the graph has been built again. It is the SHA-1 digest of the sorted
+    nodes and edges, so unlike the built-in hash it is the same in every run of the program.
+
+    Precondition: The nodes of the graph are integers, like the ones of the default graph.
+    """
+    nodes = numpy.sort(numpy.fromiter(graph.nodes(), dtype=numpy.int64, count=graph.number_of_nodes()))
+    edges = numpy.array(sorted(graph.edges()), dtype=numpy.int64)
+    return hashlib.sha1(nodes.tobytes() + edges.tobytes()).hexdigest()
+
+
+def save_graph_data(data, graph, filename):
+    """Saves the object 'data', which has been built from the specified graph, to a file with the
+    specified filename, together with the fingerprint of the graph (see get_graph_fingerprint).
+    """
+    save_data({"graph_fingerprint": get_graph_fingerprint(graph), "data": data}, filename)
+
+
+def load_graph_data(graph, filename):
+    """Returns the object stored in the file with the specified filename using save_graph_data, or
+    None if the file does not exist or the object was not built from the specified graph (the
+    fingerprint of the graph is different), in which case it has to be built again. Files in other
+    formats, like the ones written by previous versions of iGo, are also ignored.
+
+    Precondition: If the file exists, it is a pickled representation of an object.
+    """
+    if not file_exists(filename):
+        return None
+    stored = load_data(filename)
+    if not isinstance(stored, dict) or stored.get("graph_fingerprint") != get_graph_fingerprint(graph):
+        return None
+    return stored["data"]
+
+
+def attribute_to_number(value):
+    """Returns the value of a node or edge attribute as a number. Strings are converted to floats,
+    and lists (which OSMnx uses when a street has several values for the same attribute, like
+    'maxspeed') are converted to the mean of their values. Numbers are returned unmodified.
+    """
+    if isinstance(value, list):
+        numbers = [attribute_to_number(item) for item in value]
+        return sum(numbers) / len(numbers)
+    if isinstance(value, str):
+        return float(value)
+    return value
+
+
+def graph_to_csr(graph):
+    """Returns the adjacency of the directed graph in CSR (compressed sparse row) format, as a tuple
+    (nodes, indptr, indices, edges_data).
+
+    'nodes' is the list of nodes of the graph, and the successors of the i-th node are the nodes
+    in the positions indices[indptr[i]:indptr[i + 1]] of this list. 'edges_data' is the list of the
+    attribute dictionaries of the edges, in the same order as 'indices'. Both 'indptr' and 'indices'
+    are NumPy arrays.
+    """
+    nodes = list(graph.nodes())
+    node_index = {node: i for i, node in enumerate(nodes)}
+
+    indptr, indices, edges_data = [0], [], []
+    for node in nodes:
+        for successor, edge_data in graph.succ[node].items():
+            indices.append(node_index[successor])
+            edges_data.append(edge_data)
+        indptr.append(len(indices))
+
+    return nodes, numpy.array(indptr, dtype=numpy.int64), numpy.array(indices, dtype=numpy.int64), edges_data
+
+
+# Attributes stored by save_graph, which are the only ones used by iGo.
+GRAPH_NODE_ATTRIBUTES = ("x", "y", "metanode")
+GRAPH_EDGE_ATTRIBUTES = ("length", "maxspeed", "bearing", "itime")
+def save_graph(graph, filename):
+    """Saves the directed graph to a file with the specified filename. Instead of pickling the
+    graph, which stores a Python dictionary for every node and edge, it is stored as a handful of
+    NumPy arrays with only the attributes used by iGo. This drops the many other attributes that
+    OSMnx adds to the downloaded graph (like the names and the geometries of the streets), which a
+    pickle of the default graph would store. Loading it with load_graph is not faster than
+    unpickling a graph with the same attributes, because the graph is built again edge by edge, so
+    graphs that only have the attributes used by iGo (like the igraphs) are better pickled.
+
+    The adjacency of the graph is stored in CSR format (see graph_to_csr), and each attribute is
+    stored as an array aligned with the nodes or with the edges, where missing values are NaN. Only
+    the node attributes in GRAPH_NODE_ATTRIBUTES and the edge attributes in GRAPH_EDGE_ATTRIBUTES
+    are stored, converted to numbers with attribute_to_number (so a list of maximum speeds is stored
+    as its mean).
+
+    Precondition: The nodes of the graph are either all integers or all strings.
+    """
+    nodes, indptr, indices, edges_data = graph_to_csr(graph)
+    arrays = {"nodes": numpy.array(nodes), "indptr": indptr, "indices": indices}
+
+    for prefix, attributes, datas in (("node_", GRAPH_NODE_ATTRIBUTES, [graph.nodes[node] for node in nodes]),
+                                      ("edge_", GRAPH_EDGE_ATTRIBUTES, edges_data)):
+        for attribute in attributes:
+            # Do not store the attributes that the graph does not have.
+            if any(attribute in data for data in datas):
+                values = [attribute_to_number(data[attribute]) if attribute in data else math.nan for data in datas]
+                arrays[prefix + attribute] = numpy.array(values)
+
+    # Use the file object, so NumPy does not append the '.npz' extension to the filename.
+    with open(filename, "wb") as file:
+        numpy.savez(file, **arrays)
+
+
+def load_graph(filename):
+    """Returns a directed graph that has previously been stored in a file with the specified
+    filename using save_graph. The nodes and edges only have the attributes stored by save_graph.
+
+    Precondition: The file exists and has been written by save_graph.
+    """
+    with numpy.load(filename) as arrays:
+        nodes = arrays["nodes"].tolist()
+        indptr, indices = arrays["indptr"], arrays["indices"].tolist()
+        node_columns = {name[len("node_"):]: arrays[name].tolist() for name in arrays.files if name.startswith("node_")}
+        edge_columns = {name[len("edge_"):]: arrays[name].tolist() for name in arrays.files if name.startswith("edge_")}
+
+    # The source node of every edge, which is implicit in the CSR format.
+    sources = numpy.repeat(numpy.arange(len(nodes)), numpy.diff(indptr)).tolist()
+
+    # NaN values represent missing attributes, so they are not added to the graph.
+    graph = networkx.DiGraph()
+    graph.add_nodes_from((node, {attribute: column[i] for attribute, column in node_columns.items()
+                                 if not math.isnan(column[i])})
+                         for i, node in enumerate(nodes))
+    graph.add_edges_from((nodes[sources[i]], nodes[indices[i]],
+                          {attribute: column[i] for attribute, column in edge_columns.items() if not math.isnan(column[i])})
+                         for i in range(len(indices)))
+
+    return graph
+
+
+@functools.lru_cache(maxsize=32)
+def get_place_shape(place):
+    """Returns the shape of the boundaries of the specified place as a prepared shapely geometry,
+    which is faster to test against many points than the plain geometry. The shape is retrieved
+    from the Nominatim API only the first time the function is called for a place.
+
+    Precondition: 'place' is a geocodable string by the Nominatim API.
+    """
+    # Retrieve 'place' from the Nominatim API as a GeoDataFrame and take its geometry as a polygon 
+    # constructed from a list of coordinates.
+    return shapely.prepared.prep(osmnx.geocode_to_gdf(place).loc[0, "geometry"])
+
+
 def is_in_place(coordinates, place):
     """Returns True if the coordinates are inside the boundaries of the specified place.
     
@@ -63,17 +220,16 @@ def is_in_place(coordinates, place):
     # The coordinates must be converted to a shapely.geometry.Point to use .intersects().
     point = shapely.geometry.Point(coordinates.longitude, coordinates.latitude)
 
-    # Retrieve 'place' from the Nominatim API as a GeoDataFrame and take its geometry as a polygon 
-    # constructed from a list of coordinates.
-    shape = osmnx.geocode_to_gdf(place).loc[0, "geometry"] 
-
     # Return True if the point is inside the shape's boundary.
-    return shape.intersects(point) 
+    return get_place_shape(place).intersects(point)
 
 
-# The regex is compiled outside to not repeat computations.
-coordinates_regex = re.compile(r'-?[1-9][0-9]*(\.[0-9]+)?[,\s]\s*-?[1-9][0-9]*(\.[0-9]+)?')
-separator_regex = re.compile(r'[,\s]\s*')
+# The regex is compiled outside to not repeat computations. It captures both numbers of the pair,
+# whose integer part can be 0 (like in "0.5") but can not have other leading zeros.
+coordinates_regex = re.compile(r'(-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?)[,\s]\s*(-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?)')
+# The results are memoized, as the same names tend to be queried repeatedly and each query to the
+# Nominatim API costs a network round trip (osmnx also caches its HTTP responses on disk).
+@functools.lru_cache(maxsize=1024)
 def name_to_coordinates(name, place, coordinates_order="lng-lat"):
     """Returns the coordinates given a string 'name', which can either be a geocodable string by
     the Nominatim API or a string representing a pair of coordinates. If the coordinates include a
@@ -102,10 +258,10 @@ def name_to_coordinates(name, place, coordinates_order="lng-lat"):
      Precondition: coordinates_order is either "lng-lat" (default) or "lat-lng".
     """
     # Use regex to know if 'name' is a string representing a pair of coordinates or a literal place name.
-    if coordinates_regex.fullmatch(name):
-        # Also use regex to split the pair of coordinates.
-        lng, lat = re.split(separator_regex, name)
-        lng, lat = float(lng), float(lat)
+    coordinates_match = coordinates_regex.fullmatch(name)
+    if coordinates_match:
+        # The numbers of the pair are the groups captured by the regex.
+        lng, lat = float(coordinates_match.group(1)), float(coordinates_match.group(2))
 
         # Swap the coordinates if specified.
         if coordinates_order == "lat-lng":
@@ -127,16 +283,41 @@ def name_to_coordinates(name, place, coordinates_order="lng-lat"):
     return coordinates
 
 
+# Mean radius of the Earth in meters, used by the haversine formula, and other constants used to
+# compute it.
+EARTH_RADIUS = 6371008.8
+EARTH_DIAMETER = 2 * EARTH_RADIUS
+DEGREES_TO_RADIANS = math.pi / 180
 def haversine(coordinates1, coordinates2):
     """Returns the great-circle distance between two points on the Earth surface, given their
     coordinates.
 
     To calculate the result, the function uses the haversine formula.
     """
-    lng1, lat1 = math.radians(coordinates1.longitude), math.radians(coordinates1.latitude)
-    lng2, lat2 = math.radians(coordinates2.longitude), math.radians(coordinates2.latitude)
-    d = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
-    return 2 * 6371008.8 * math.asin(math.sqrt(d))
+    # This function is called for every node explored by the A* searches of build_highway_paths, so
+    # the conversion to radians is done with a multiplication, the squares are products instead of
+    # powers, and the coordinates are unpacked as tuples instead of reading their attributes.
+    lng1, lat1 = coordinates1
+    lng2, lat2 = coordinates2
+    lat1, lat2 = lat1 * DEGREES_TO_RADIANS, lat2 * DEGREES_TO_RADIANS
+    sin_half_dlat = math.sin((lat2 - lat1) * 0.5)
+    sin_half_dlng = math.sin((lng2 - lng1) * (DEGREES_TO_RADIANS * 0.5))
+    d = sin_half_dlat * sin_half_dlat + math.cos(lat1) * math.cos(lat2) * sin_half_dlng * sin_half_dlng
+    return EARTH_DIAMETER * math.asin(math.sqrt(d))
+
+
+def coordinates_to_xyz(longitudes, latitudes):
+    """Returns a NumPy array with one row (x, y, z) for each pair of longitude and latitude, which
+    are the Cartesian coordinates of the point on a sphere of radius 1. The longitudes and
+    latitudes can be either numbers or NumPy arrays.
+
+    The straight-line distance between two of these points grows with the great-circle distance
+    between them, so the nearest point in 3D space is also the nearest point on the Earth surface.
+    """
+    lngs, lats = numpy.radians(longitudes), numpy.radians(latitudes)
+    return numpy.column_stack((numpy.cos(lats) * numpy.cos(lngs),
+                               numpy.cos(lats) * numpy.sin(lngs),
+                               numpy.sin(lats)))
 
 
 def coordinates_to_node(graph, coordinates):
@@ -147,34 +328,88 @@ def coordinates_to_node(graph, coordinates):
 
     Note: If several nodes are at the same distance, only one of them is returned.
     """
-    nearest_node = None
-    nearest_distance = float("inf")
+    return coordinates_to_nodes(graph, [coordinates])[0]
+
+
+def coordinates_to_nodes(graph, coordinates_list):
+    """Returns a list with the node of the graph that is closest to each of the Coordinates of
+    'coordinates_list'. All the nodes are found with a single query to the k-d tree of the graph,
+    so it is much faster than calling coordinates_to_node for every Coordinates.
+
+    'coordinates_list' can also be a NumPy array with a row of longitude and latitude for each
+    point, like the coordinates of a Highway.
+
+    Precondition: All the nodes of the graph have two attributes 'x' and 'y', which indicate
+    their longitude and latitude, respectively.
+
+    Note: If several nodes are at the same distance, only one of them is returned.
+    """
+    # Coordinates are (longitude, latitude) tuples, so a list of them is converted to the same array.
+    coordinates_array = numpy.asarray(coordinates_list, dtype=float).reshape(-1, 2)
 
-    for node in graph.nodes():
-        distance = haversine(node_to_coordinates(graph, node), coordinates)
-        if distance < nearest_distance:
-            nearest_distance = distance
-            nearest_node = node
+    # Query the k-d tree of the nodes of the graph with the points on the sphere of the coordinates.
+    tree, nodes = get_nodes_kdtree(graph)
+    _, indices = tree.query(coordinates_to_xyz(coordinates_array[:, 0], coordinates_array[:, 1]))
+    return [nodes[index] for index in indices]
 
-    return nearest_node
+
+def get_coordinates_dictionary(graph):
+    """Returns a dictionary from node to the Coordinates of that node, for all the nodes of the
+    graph. It is built only the first time the function is called for a graph, and then it is
+    stored in the graph attribute 'coordinates', so functions that need the coordinates of many
+    nodes can look them up directly instead of reading the attributes of every node.
+
+    Preconditions:
+     - All the nodes of the graph have two attributes 'x' and 'y', which indicate their longitude
+       and latitude, respectively.
+     - No nodes are added to the graph after calling this function for the first time.
+    """
+    if "coordinates" not in graph.graph:
+        graph.graph["coordinates"] = {node: Coordinates(node_data["x"], node_data["y"])
+                                      for node, node_data in graph.nodes(data=True)}
+    return graph.graph["coordinates"]
+
+
+def get_nodes_kdtree(graph):
+    """Returns a tuple with a k-d tree of the nodes of the graph and the list of the nodes, in the
+    same order as the points of the tree. The points are the Cartesian coordinates of the nodes
+    on a sphere (see coordinates_to_xyz). It is built only the first time the function is called
+    for a graph, and then it is stored in the graph attribute 'kdtree', so the nearest node to
+    some coordinates can be found without computing the distance to every node.
+
+    Preconditions:
+     - All the nodes of the graph have two attributes 'x' and 'y', which indicate their longitude
+       and latitude, respectively.
+     - No nodes are added to the graph after calling this function for the first time.
+    """
+    if "kdtree" not in graph.graph:
+        coordinates = get_coordinates_dictionary(graph)
+        nodes = list(coordinates)
+        longitudes = numpy.fromiter((node_coordinates.longitude for node_coordinates in coordinates.values()),
+                                    dtype=float, count=len(nodes))
+        latitudes = numpy.fromiter((node_coordinates.latitude for node_coordinates in coordinates.values()),
+                                   dtype=float, count=len(nodes))
+        graph.graph["kdtree"] = (scipy.spatial.cKDTree(coordinates_to_xyz(longitudes, latitudes)), nodes)
+    return graph.graph["kdtree"]
 
 
 def node_to_coordinates(graph, node_id):
     """Returns the Coordinates of the node of the graph identified by 'node_id'.
 
     Precondition: The node has two attributes 'x' and 'y', which indicate its longitude and
-    latitude, respectively.
+    latitude, respectively (see get_coordinates_dictionary, which is used to look them up).
     """
-    return Coordinates(graph.nodes[node_id]["x"], graph.nodes[node_id]["y"])
+    return get_coordinates_dictionary(graph)[node_id]
 
 
 def nodes_to_coordinates_list(graph, node_list):
     """Returns a list of Coordinates given a list of nodes of the graph.
 
     Precondition: The nodes have two attributes 'x' and 'y', which indicate their longitude and
-    latitude, respectively.
+    latitude, respectively (see get_coordinates_dictionary, which is used to look them up).
     """
-    return [node_to_coordinates(graph, node) for node in node_list]
+    coordinates = get_coordinates_dictionary(graph)
+    return [coordinates[node] for node in node_list]
 
 
 def build_default_graph(place):
@@ -211,8 +446,15 @@ def build_default_graph(place):
     # Barcelona, it has more than 200 strongly connected components (SCCs)!) This makes it 
     # impossible to find a path between some nodes (if they are in different SCCs). Fortunately, 
     # all the SCCs are very small (<10 nodes) except for the main one (>8000 nodes). With the
-    # following line, the graph is overwritten to only be this main SCC.
-    graph = graph.subgraph(max(networkx.strongly_connected_components(graph), key=len)).copy()
+    # following lines, the nodes of the rest of SCCs are removed from the graph, so it is only this
+    # main SCC. The SCCs are computed by SciPy over the adjacency matrix of the graph, which is
+    # much faster than doing it with NetworkX.
+    nodes, indptr, indices, _ = graph_to_csr(graph)
+    adjacency = scipy.sparse.csr_matrix((numpy.ones(len(indices), dtype=bool), indices, indptr),
+                                        shape=(len(nodes), len(nodes)))
+    _, labels = scipy.sparse.csgraph.connected_components(adjacency, directed=True, connection="strong")
+    main_label = numpy.bincount(labels).argmax()
+    graph.remove_nodes_from([node for node, label in zip(nodes, labels) if label != main_label])
     
     return graph
 
@@ -226,10 +468,12 @@ def download_highways(highways_url):
     These coordinates are the points that define the highway in a map.
 
     This information is stored and returned as a dictionary from way ID to Highway (a named tuple
-    with two attributes: 'description' and 'coordinates_list').
+    with two attributes: 'description' and 'coordinates', a NumPy array with a row of longitude and
+    latitude for each point).
     """
     with urllib.request.urlopen(highways_url) as response:
-        lines = [line.decode("utf-8") for line in response.readlines()]
+        # Decode the response while it is being read, instead of materializing all its lines.
+        lines = io.TextIOWrapper(response, encoding="utf-8", newline="")
         reader = csv.reader(lines, delimiter=",", quotechar="\"")
         next(reader)  # Ignore first line with description.
 
@@ -237,12 +481,9 @@ def download_highways(highways_url):
         for line in reader:
             way_id, description, coordinates_str = line
             way_id = int(way_id)  # Way IDs are originally read as strings.
-            all_coordinate_list = list(map(float, coordinates_str.split(",")))
-            coordinates_list = []
-            for i in range(0, len(all_coordinate_list), 2):
-                # Save pairs of Coordinates.
-                coordinates_list.append(Coordinates(all_coordinate_list[i], all_coordinate_list[i + 1]))
-            highways[way_id] = Highway(description, coordinates_list)
+            # Parse all the values at once with NumPy, and arrange them in longitude-latitude pairs.
+            coordinates = numpy.fromstring(coordinates_str, sep=",").reshape(-1, 2)
+            highways[way_id] = Highway(description, coordinates)
         
         return highways
 
@@ -258,15 +499,37 @@ def build_highway_paths(graph, highways):
        respectively.
      - Every edge has the attribute 'length', in meters.
     """
+    # There is nothing to concatenate nor to search if there are no highways.
+    if not highways:
+        return {}
+
+    # Find the nearest nodes to the coordinates of all the highways at once, and then take the
+    # nodes of each highway from the resulting list.
+    all_nodes = coordinates_to_nodes(graph, numpy.concatenate([highway.coordinates for highway in highways.values()]))
+
+    # The great-circle distance between two nodes is never longer than a path between them, so it
+    # is used as the heuristic of the A* search of the paths between consecutive highway nodes.
+    coordinates = get_coordinates_dictionary(graph)
+    def distance(node1, node2):
+        return haversine(coordinates[node1], coordinates[node2])
+
+    # Many highways share segments, so the path of every pair of nodes is searched only once.
+    segment_paths = {}
+
     highway_paths = {}
+    start = 0
     for way_id, highway in highways.items():
+        highway_nodes = all_nodes[start:start + len(highway.coordinates)]
+        start += len(highway.coordinates)
+
         highway_paths[way_id] = []
-        for i in range(len(highway.coordinates_list) - 1):
-            node1 = coordinates_to_node(graph, highway.coordinates_list[i])
-            node2 = coordinates_to_node(graph, highway.coordinates_list[i + 1])
+        for i in range(len(highway_nodes) - 1):
+            node1, node2 = highway_nodes[i], highway_nodes[i + 1]
             if i > 0:
                 highway_paths[way_id].pop()  # Avoid repeated nodes from concatenatig paths.
-            highway_paths[way_id].extend(osmnx.distance.shortest_path(graph, node1, node2, weight="length"))
+            if (node1, node2) not in segment_paths:
+                segment_paths[(node1, node2)] = networkx.astar_path(graph, node1, node2, heuristic=distance, weight="length")
+            highway_paths[way_id].extend(segment_paths[(node1, node2)])
     return highway_paths
 
 
@@ -291,32 +554,39 @@ def set_default_itime(graph):
      - Every edge has the attribute 'length', in meters.
      - If an edge has the attribute 'maxspeed', it is in km/h.
     """
-    for node1, node2, edge_data in graph.edges(data=True):
-        if "maxspeed" in edge_data:
-            if type(edge_data["maxspeed"]) is not list:
-                edge_data["maxspeed"] = float(edge_data["maxspeed"])  # 'maxspeed' is originally a string.
-            else:  # The edges that have more than one 'maxspeed'.
-                maxspeeds = [float(maxspeed) for maxspeed in edge_data["maxspeed"]]
-                edge_data["maxspeed"] = statistics.mean(maxspeeds)
-        else:
-            edge_data["maxspeed"] = 30
+    edges_data = [edge_data for node1, node2, edge_data in graph.edges(data=True)]
 
-        edge_data["maxspeed"] *= 1000 / 3600  # Convert from km/h to m/s.
-        graph[node1][node2]["itime"] = edge_data["length"] / edge_data["maxspeed"]
+    # Read the lengths and the maximum speeds of all the edges into NumPy arrays. 'maxspeed' is
+    # originally a string, or a list of strings if the edge has more than one (see
+    # attribute_to_number).
+    lengths = numpy.fromiter((edge_data["length"] for edge_data in edges_data), dtype=float, count=len(edges_data))
+    maxspeeds = numpy.fromiter((attribute_to_number(edge_data.get("maxspeed", 30)) for edge_data in edges_data),
+                               dtype=float, count=len(edges_data))
 
+    # Compute the 'maxspeed' and 'itime' of all the edges at once.
+    maxspeeds *= 1000 / 3600  # Convert from km/h to m/s.
+    itimes = lengths / maxspeeds
 
-def bearing_itime(igraph, predecessor, node, successor):
+    # Store the results in the edges.
+    for edge_data, maxspeed, itime in zip(edges_data, maxspeeds.tolist(), itimes.tolist()):
+        edge_data["maxspeed"] = maxspeed
+        edge_data["itime"] = itime
+
+
+def bearing_itime(in_bearings, out_bearings):
     """Returns the time cost in seconds of going through two adjacent edges depending on the angle
-    they form given three inodes: predecessor (the source), node (the one both edges have in common) 
-    and successor (the destination), and also depending on if the turn given by this angle is done
-    to the left or to the right.
+    they form given the bearings of both edges: 'in_bearings', the one of the edge that enters the
+    node both edges have in common, and 'out_bearings', the one of the edge that exits it. It also
+    depends on if the turn given by this angle is done to the left or to the right. The bearings
+    can be either numbers or NumPy arrays, in which case a NumPy array with the cost of every pair
+    of edges is returned, computing all of them at once.
 
     This value is computed using a piecewise function from the angle between the two edges, which is
-    first calculated from the edge attribute 'bearing'. This angle goes from -180 to 180 degrees,
-    where the sign indicates the orientation (left or right). However, the mathematical function is 
-    evaluated on the absolute value of it. Moreover, the point where it changes is 50, which is
-    considered a frontier between turning and going straight with a slight curve. A graph of the
-    mathematical function can be seen here: https://www.geogebra.org/calculator/fdnnamqy.
+    first calculated from their bearings. This angle goes from -180 to 180 degrees, where the sign
+    indicates the orientation (left or right). However, the mathematical function is evaluated on
+    the absolute value of it. Moreover, the point where it changes is 50, which is considered a
+    frontier between turning and going straight with a slight curve. A graph of the mathematical
+    function can be seen here: https://www.geogebra.org/calculator/fdnnamqy.
 
     This function evaluated on the most remarkable angles has the following values:
     angle |   0   |   45   |   50   |   90   |   135   |   180   |
@@ -326,33 +596,44 @@ def bearing_itime(igraph, predecessor, node, successor):
     and 1.5 if the turn is of more than 15 degrees to the left, since it is slower to turn left 
     than it is to turn right.
 
-    Preconditions: 
-     - 'predecessor', 'node', and 'successor' are inodes of the igraph.
-     - The edges connecting the inodes have a valid 'bearing' attribute.
+    Precondition: The bearings are in degrees, between 0 and 360.
     """
     # Calculate the angle between both edges and normalize it between -180 and 180 degrees.
-    bearing = igraph[node][successor]["bearing"] - igraph[predecessor][node]["bearing"]
-    if bearing < -180:
-        bearing += 360
-    elif bearing > 180:
-        bearing -= 360
+    bearings = numpy.subtract(out_bearings, in_bearings)
+    bearings = numpy.where(bearings < -180, bearings + 360, numpy.where(bearings > 180, bearings - 360, bearings))
 
-    # Calculate the side factor.
-    side_factor = 1
-    if bearing < -15:  # -15 is 15 degrees to the left.
-        side_factor = 1.5
+    # Calculate the side factor. -15 is 15 degrees to the left.
+    side_factors = numpy.where(bearings < -15, 1.5, 1)
 
     # Get the absolute value.
-    if bearing < 0:
-        bearing = -bearing
+    bearings = numpy.abs(bearings)
+
+    # Compute the cost differently depending on the bearing. Both branches are evaluated for all the
+    # bearings, so the logarithm is only given bearings of at least 50 to avoid computing log(0).
+    bearing_costs = numpy.where(bearings < 50, numpy.exp(bearings / 45) - 1,
+                                numpy.log((numpy.maximum(bearings, 50) - 45) ** 2))
+
+    return bearing_costs * side_factors
+
+
+def in_inode(node, predecessor):
+    """Returns the ID of the In inode of 'node' for the edge that enters it from 'predecessor'."""
+    return f"I_{node}_{predecessor}"
 
-    # Compute the cost differently depending on the bearing.
-    if bearing < 50:
-        bearing_cost = math.exp(bearing / 45) - 1
-    else:
-        bearing_cost = math.log((bearing - 45) ** 2)
 
-    return bearing_cost * side_factor
+def out_inode(node, successor):
+    """Returns the ID of the Out inode of 'node' for the edge that exits it to 'successor'."""
+    return f"O_{node}_{successor}"
+
+
+def source_inode(node):
+    """Returns the ID of the Source inode of 'node'."""
+    return f"S_{node}"
+
+
+def destination_inode(node):
+    """Returns the ID of the Destination inode of 'node'."""
+    return f"D_{node}"
 
 
 def build_igraph_with_bearings(graph):
@@ -409,44 +690,55 @@ def build_igraph_with_bearings(graph):
        the geodesic line from the origin node to the destination node.
      - No self-loop edges exist in the graph.
     """
-    # Create a new directed graph from scratch.
-    igraph_with_bearings = networkx.DiGraph()
+    # The inodes and the edges of the igraph are collected in lists and added all at once at the
+    # end. The bearing edges are kept apart along with the bearings of the real edges they join, so
+    # the itimes of all of them are computed with a single call to bearing_itime.
+    inodes, bearing_edges, path_ends_edges = [], [], []
+    in_bearings, out_bearings = [], []
 
     # Iterate for every node of the given graph, which is only used to read information and is not modified.
     for node, node_data in graph.nodes(data=True):
-        in_nodes, out_nodes = [], []
-
-        # Add In inodes.
-        for predecessor in graph.predecessors(node):
-            id = "I_" + str(node) + "_" + str(predecessor)
-            igraph_with_bearings.add_node(id, x=node_data["x"], y=node_data["y"], metanode=node)
-            in_nodes.append((id, predecessor))
-
-        # Add Out inodes.
-        for successor in graph.successors(node):
-            id = "O_" + str(node) + "_" + str(successor)
-            igraph_with_bearings.add_node(id, x=node_data["x"], y=node_data["y"], metanode=node)
-            out_nodes.append((id, successor))
-
-        # Add bearing edges (In -> Out), with the itime associated to turning.
-        for in_node, predecessor in in_nodes:
-            for out_node, successor in out_nodes:
-                igraph_with_bearings.add_edge(in_node, out_node, itime=bearing_itime(graph, predecessor, node, successor))
-
-        # Add the Source inode, and connect it to every Out inode (Source -> Out).
-        igraph_with_bearings.add_node("S_" + str(node), x=node_data["x"], y=node_data["y"], metanode=node)
-        for out_node, predecessor in out_nodes:
-            igraph_with_bearings.add_edge("S_" + str(node), out_node, itime=0)
-
-        # Add the Destination inode, and connect it to every In inode (In -> Destination).
-        igraph_with_bearings.add_node("D_" + str(node), x=node_data["x"], y=node_data["y"], metanode=node)
-        for in_node, successor in in_nodes:
-            igraph_with_bearings.add_edge(in_node, "D_" + str(node), itime=0)
+        inode_data = {"x": node_data["x"], "y": node_data["y"], "metanode": node}
+
+        # In inodes, with the bearing of the edge that enters the node from each predecessor.
+        in_nodes = [(in_inode(node, predecessor), edge_data["bearing"])
+                    for predecessor, edge_data in graph.pred[node].items()]
+
+        # Out inodes, with the bearing of the edge that exits the node to each successor.
+        out_nodes = [(out_inode(node, successor), edge_data["bearing"])
+                     for successor, edge_data in graph.succ[node].items()]
+
+        # Add In, Out, Source and Destination inodes.
+        source, destination = source_inode(node), destination_inode(node)
+        inodes.extend((in_node, inode_data) for in_node, _ in in_nodes)
+        inodes.extend((out_node, inode_data) for out_node, _ in out_nodes)
+        inodes.append((source, inode_data))
+        inodes.append((destination, inode_data))
+
+        # Add bearing edges (In -> Out), whose itime is associated to turning.
+        for in_node, in_bearing in in_nodes:
+            for out_node, out_bearing in out_nodes:
+                bearing_edges.append((in_node, out_node))
+                in_bearings.append(in_bearing)
+                out_bearings.append(out_bearing)
+
+        # Connect the Source inode to every Out inode (Source -> Out), and every In inode to the
+        # Destination inode (In -> Destination).
+        path_ends_edges.extend((source, out_node) for out_node, _ in out_nodes)
+        path_ends_edges.extend((in_node, destination) for in_node, _ in in_nodes)
+
+    # Create a new directed graph from scratch, and add all the inodes and edges.
+    igraph_with_bearings = networkx.DiGraph()
+    igraph_with_bearings.add_nodes_from(inodes)
+    bearing_itimes = bearing_itime(numpy.array(in_bearings, dtype=float), numpy.array(out_bearings, dtype=float))
+    igraph_with_bearings.add_edges_from((in_node, out_node, {"itime": itime})
+                                        for (in_node, out_node), itime in zip(bearing_edges, bearing_itimes.tolist()))
+    igraph_with_bearings.add_edges_from(path_ends_edges, itime=0)
 
     # Add the real edges of the graph (Out -> In). Their 'itime' and 'length' attributes are maintained.
-    for node1, node2, edge_data in graph.edges(data=True):
-        igraph_with_bearings.add_edge("O_" + str(node1) + "_" + str(node2), "I_" + str(node2) + "_" + str(node1),
-                                      itime=edge_data["itime"], length=edge_data["length"])
+    igraph_with_bearings.add_edges_from((out_inode(node1, node2), in_inode(node2, node1),
+                                         {"itime": edge_data["itime"], "length": edge_data["length"]})
+                                        for node1, node2, edge_data in graph.edges(data=True))
 
     return igraph_with_bearings
 
@@ -487,7 +779,8 @@ def download_congestions(congestions_url):
     'planned_state').
     """
     with urllib.request.urlopen(congestions_url) as response:
-        lines = [line.decode("utf-8") for line in response.readlines()]
+        # Decode the response while it is being read, instead of materializing all its lines.
+        lines = io.TextIOWrapper(response, encoding="utf-8", newline="")
         reader = csv.reader(lines, delimiter="#", quotechar="\"")
 
         congestions = {}
@@ -505,27 +798,33 @@ def congestion_function(congestion_state):
     across a road taking into account the traffic congestions. This value is the evaluation the
     following function on the congestion_state: https://www.geogebra.org/calculator/sy4cy7zy.
     
-    The congestion_state should be a real number between 1 and 5.
+    The congestion_state should be a real number between 1 and 5, or a NumPy array of them, in
+    which case a NumPy array with the factor of each one is returned.
 
     Table of values of the congestion_function:
     state  |   1   |    2   |    3   |    4   |   5   |
     factor |   1   |  1.14  |  1.70  |  3.32  |  8.44 |
     """
-    return math.exp((congestion_state - 1) ** 2 / 7.5)
+    return numpy.exp((congestion_state - 1) ** 2 / 7.5)
 
 
-def build_dynamic_igraph(igraph, highway_paths, congestions):
-    """Returns a new igraph built from the given one but with modified 'itime' edge attributes that
-    now take into account the current traffic data available, which is given by the congestions and
-    the highway paths.
+def build_dynamic_itimes(igraph, highway_paths, congestions):
+    """Returns a dictionary from edge of the igraph (a tuple of two inodes) to its 'itime' taking
+    into account the current traffic data available, which is given by the congestions and the
+    highway paths. Only the edges of the highway paths are in the dictionary, so the itimes of the
+    rest of edges are the ones of the igraph. This way, the igraph does not have to be copied or
+    modified, and the function can be called several times with the same igraph.
     
     Precondition: 'highway_paths' is a dictionary from way ID to list of nodes of the graph, and
     'congestions' is a dictionary from way ID to Congestion. The IDs relate both dictionaries.
     Note: 'highway_paths' has lists of nodes (integer IDs), not inodes (string IDs). This allows the
     function to use directly the value returned by build_highway_paths.
     """
-    # Make a copy of the igraph, so the function can be called several times without modifying it.
-    igraph = igraph.copy()
+    # Due to data inaccuracies, some edges are assigned more than one congestion state. Each edge
+    # gets an index in the order they are found, and every assignment of a congestion state to an
+    # edge is stored as a pair of edge index and state, so all of them are combined at once later.
+    edges_indices = {}
+    assignments_indices, assignments_states = [], []
 
     # Iterate over the highway paths and compute the congestion of every edge.
     for way_id, highway_path in highway_paths.items():
@@ -538,60 +837,96 @@ def build_dynamic_igraph(igraph, highway_paths, congestions):
         # Iterate over the edges of the highway path.
         for i in range(len(highway_path) - 1):
             # Convert from node ID to inode ID.
-            inode1 = "O_" + str(highway_path[i]) + "_" + str(highway_path[i + 1])
-            inode2 = "I_" + str(highway_path[i + 1]) + "_" + str(highway_path[i])
-            
-            # Add an edge attribute called 'congestions', which is a list with all the congestion
-            # states of the edge because, due to data inaccuracies, some edges are assigned more
-            # than one congestion state.
-            if "congestions" not in igraph[inode1][inode2]:
-                igraph[inode1][inode2]["congestions"] = [congestion_state]
-            else:
-                igraph[inode1][inode2]["congestions"].append(congestion_state)
-
-    # Calculate the itime of all the edges of the igraph.
-    for inode1, inode2 in igraph.edges():
-        if "congestions" in igraph[inode1][inode2]:
-            edge_congestions = igraph[inode1][inode2]["congestions"]
-            
-            if 6 in edge_congestions:
-                # If 6 is assigned to the edge, the road is closed, so its itime is infinity.
-                igraph[inode1][inode2]["itime"] = float("inf")
-            else:
-                # Multiply the itime of the edge by the factor returned by the congestion_function,
-                # calculated given the mean of all the congestions that have been assigned to the edge.
-                igraph[inode1][inode2]["itime"] *= congestion_function(statistics.mean(edge_congestions))
-
-    return igraph
-
-
-def get_ipath(igraph, source_coordinates, destination_coordinates):
+            inode1 = out_inode(highway_path[i], highway_path[i + 1])
+            inode2 = in_inode(highway_path[i + 1], highway_path[i])
+
+            assignments_indices.append(edges_indices.setdefault((inode1, inode2), len(edges_indices)))
+            assignments_states.append(congestion_state)
+
+    # Accumulate the sum and the number of congestion states of every edge, and whether 6 has been
+    # assigned to it.
+    assignments_indices = numpy.array(assignments_indices, dtype=numpy.int64)
+    assignments_states = numpy.array(assignments_states, dtype=float)
+    sums, counts = numpy.zeros(len(edges_indices)), numpy.zeros(len(edges_indices))
+    closed = numpy.zeros(len(edges_indices), dtype=bool)
+    numpy.add.at(sums, assignments_indices, assignments_states)
+    numpy.add.at(counts, assignments_indices, 1)
+    numpy.logical_or.at(closed, assignments_indices, assignments_states == 6)
+
+    # Multiply the itime of every edge by the factor returned by the congestion_function, calculated
+    # given the mean of all the congestions that have been assigned to the edge. If 6 is assigned to
+    # the edge, the road is closed, so its itime is infinity.
+    itimes = numpy.fromiter((igraph[inode1][inode2]["itime"] for inode1, inode2 in edges_indices),
+                            dtype=float, count=len(edges_indices))
+    itimes = numpy.where(closed, math.inf, itimes * congestion_function(sums / counts))
+    dynamic_itimes = dict(zip(edges_indices, itimes.tolist()))
+
+    return dynamic_itimes
+
+
+def get_ipath(igraph, source_coordinates, destination_coordinates, dynamic_itimes=None):
     """Returns the shortest intelligently searched path in an igraph, from the specified source 
     coordinates to the specified destination coordinates, or None if there is no path.
     
     The path is searched minimizing the edge attribute 'itime', that takes into account the length,
     the maximum driving speed and the current traffic data of a road, plus the time it takes to turn
-    depending on the angle and the side of this turn.
+    depending on the angle and the side of this turn. If 'dynamic_itimes' is given (see
+    build_dynamic_itimes), its itimes are used instead of the ones of the igraph for its edges.
     """
-    # Convert the source and destination coordinates to a Source and Destination inodes, respectively.
-    source = "S_" + str(igraph.nodes[coordinates_to_node(igraph, source_coordinates)]["metanode"])
-    destination = "D_" + str(igraph.nodes[coordinates_to_node(igraph, destination_coordinates)]["metanode"])
-
-    # Use [source] and [destination] to avoid OSMnx to iterate the characters of the inode IDs.
-    # Since a list is passed, it returns a list too, but it always has length one.
-    ipath = osmnx.distance.shortest_path(igraph, [source], [destination], weight="itime")[0]
+    # The itime of an edge is the dynamic one if it exists, or the one of the igraph otherwise.
+    if dynamic_itimes is None:
+        dynamic_itimes = {}
+    def itime(inode1, inode2, edge_data):
+        return dynamic_itimes.get((inode1, inode2), edge_data["itime"])
 
-    # Return None if no path is found (if the source and destination inodes are in different SCCs).
-    if not ipath:
+    # Convert the source and destination coordinates to a Source and Destination inodes, respectively.
+    source = source_inode(igraph.nodes[coordinates_to_node(igraph, source_coordinates)]["metanode"])
+    destination = destination_inode(igraph.nodes[coordinates_to_node(igraph, destination_coordinates)]["metanode"])
+
+    # Search the path from both ends at once with a bidirectional Dijkstra, which also returns the
+    # total itime of the path. Return None if no path is found (if the source and destination
+    # inodes are in different SCCs).
+    try:
+        total_itime, ipath = networkx.bidirectional_dijkstra(igraph, source, destination, weight=itime)
+    except networkx.NetworkXNoPath:
         return None
 
-    # Return None if the only way of going from the source to the destination is through a closed road.
-    for i in range(len(ipath) - 1):
-        if igraph[ipath[i]][ipath[i + 1]]["itime"] is float("inf"):
-            return None
+    # Return None if the only way of going from the source to the destination is through a closed
+    # road, which is the case when the total itime is infinity.
+    if math.isinf(total_itime):
+        return None
 
     # Convert the inodes back to coordinates and return the path.
-    return [source_coordinates] + [node_to_coordinates(igraph, id) for id in ipath] + [destination_coordinates]
+    coordinates = get_coordinates_dictionary(igraph)
+    return [source_coordinates] + [coordinates[id] for id in ipath] + [destination_coordinates]
+
+
+# Tiles downloaded by the maps, shared by all of them, as a dictionary from tile URL to the tuple
+# (status code, content) of its response. Only the last MAX_CACHED_TILES tiles are kept. The maps
+# download their tiles from several threads, so the cache is only accessed with its lock held.
+tiles_cache = {}
+tiles_cache_lock = threading.Lock()
+MAX_CACHED_TILES = 1024
+class CachedTilesStaticMap(staticmap.StaticMap):
+    """A StaticMap that keeps the tiles it downloads in 'tiles_cache', so the maps rendered later
+    that cover the same area (like all the plots of the same place) do not download them again.
+    """
+    def get(self, url, **kwargs):
+        """Returns the status code and the content of the tile with the specified URL, downloading
+        it only if it is not cached. Only the successful responses are cached.
+        """
+        with tiles_cache_lock:
+            tile = tiles_cache.get(url)
+        if tile is None:
+            # The lock is not held while downloading, so the other tiles are downloaded meanwhile.
+            tile = super().get(url, **kwargs)
+            if tile[0] == 200:
+                with tiles_cache_lock:
+                    # Forget the oldest tile if the cache is full. Dictionaries keep their insertion order.
+                    if url not in tiles_cache and len(tiles_cache) >= MAX_CACHED_TILES:
+                        tiles_cache.pop(next(iter(tiles_cache)))
+                    tiles_cache[url] = tile
+        return tile
 
 
 def get_highways_plot(graph, highway_paths, size):
@@ -605,7 +940,7 @@ def get_highways_plot(graph, highway_paths, size):
      - 'size' is a positive integer that indicates the dimensions in pixels of the map.
     """
     # Create an empty square map of the given size.
-    map = staticmap.StaticMap(size, size)
+    map = CachedTilesStaticMap(size, size)
 
     for path in highway_paths.values():
         # Draw a 2px line using the coordinates of the highway_paths nodes.
@@ -615,13 +950,16 @@ def get_highways_plot(graph, highway_paths, size):
     return map
 
 
+# The tuple relates each congestion state (its index) to the color used to paint it. It is defined
+# outside get_congestions_plot to not build it again for every highway.
+CONGESTION_COLORS = ("#a9a9a9", "#228b22", "#7cfc00", "#ffa500", "#ff4500", "#bb0202", "#510101")
 def get_congestions_plot(graph, highway_paths, congestions, size):
     """Returns a square StaticMap of the specified size with the highway_paths plotted with 2px
     lines of different colors depending on their associated congestion state, which is given by
     the specified congestions parameter. A highway and its congestion are related by their way IDs,
     and they are plotted using the coordinates of the highway_paths nodes.
 
-    The chosen colors for each state from 0 to 6 are:
+    The chosen colors for each state from 0 to 6 (see CONGESTION_COLORS) are:
     Gray, Forest Green, Lawn Green, Orange, Orange Red, Dark Red, and Dark Maroon, respectively.
 
     Preconditions: 
@@ -632,84 +970,97 @@ def get_congestions_plot(graph, highway_paths, congestions, size):
      - 'size' is a positive integer that indicates the dimensions in pixels of the map.
     """
     # Create an empty square map of the given size.
-    map = staticmap.StaticMap(size, size)
+    map = CachedTilesStaticMap(size, size)
 
     for way_id, path in highway_paths.items():
         # Every highway_path has a corresponding congestion from the way_id relation.
         congestion_state = congestions[way_id].current_state
 
-        # A list is used to relate the congestion_state to the color that is used to paint the lines.
-        congestion_colors = ["#a9a9a9", "#228b22", "#7cfc00", "#ffa500", "#ff4500", "#bb0202", "#510101"]
-
         # Draw a 2px line of the corresponding color using the coordinates of the highway_paths nodes.
-        congestion_line = staticmap.Line(nodes_to_coordinates_list(graph, path), congestion_colors[congestion_state], 2)
+        congestion_line = staticmap.Line(nodes_to_coordinates_list(graph, path), CONGESTION_COLORS[congestion_state], 2)
         map.add_line(congestion_line)
 
     return map
 
 
-def icolor(ispeed, min_ispeed, max_ispeed):
-    """This is an auxiliary function of get_igraph_plot. It returns a string representing a color
-    in HSL (hue, saturation, lightness) format, where the hue of the color is directly proportional
-    to the given ispeed. min_ispeed and max_ispeed are the minimum and maximum different than zero
-    ispeed values of the igraph.
+@functools.lru_cache(maxsize=None)
+def hsl_color(hue):
+    """Returns the string of the color with the specified hue in HSL format, with 100% saturation
+    and 50% lightness. The strings are memoized, since the hues are rounded to two decimals, so
+    there are at most 16001 different ones in the range used by icolors, and most of the edges
+    of an igraph share their hue with others.
+    """
+    return "hsl({},100%,50%)".format(hue)
+
+
+def icolors(ispeeds, min_ispeed, max_ispeed):
+    """This is an auxiliary function of get_igraph_plot. It returns a list of strings representing
+    colors in HSL (hue, saturation, lightness) format, one for each ispeed of the given NumPy array,
+    where the hue of each color is directly proportional to its ispeed. min_ispeed and max_ispeed
+    are the minimum and maximum different than zero ispeed values of the igraph.
 
-    The returned icolor is computed with the proportion between the specified ispeed and the range 
-    of the igraph ispeeds, which should be the same for all the calls to the function in a single 
-    igraph plot. However, if the ispeed is zero (closed road) "black" is returned, and if the range 
-    is zero (same ispeed in all the igraph) "yellow" is returned.
+    Each icolor is computed with the proportion between its ispeed and the range of the igraph
+    ispeeds. All the proportions are computed at once using NumPy. However, if an ispeed is zero
+    (closed road) "black" is returned for it, and if the range is zero (same ispeed in all the
+    igraph) "yellow" is returned for all the roads that are not closed.
 
-    The icolor ranges from red (hue = 0 degrees), to represent the slowest streets, to medium spring
-    green (hue = 160 degrees), for the fastest ones. In between, it goes through gradient shades of 
+    The icolors range from red (hue = 0 degrees), to represent the slowest streets, to medium spring
+    green (hue = 160 degrees), for the fastest ones. In between, they go through gradient shades of 
     orange, yellow, and green. All HSL colors returned have 100% saturation, and 50% lightness.
 
-    Precondition: 0 < min_ispeed <= ispeed <= max_ispeed, or ispeed = 0, to represent a closed road.
+    Precondition: 0 < min_ispeed <= ispeed <= max_ispeed, or ispeed = 0, to represent a closed road,
+    for every ispeed of 'ispeeds'.
     """
-    if ispeed == 0:  # The road is closed.
-        return "black"
-
     ispeed_range = max_ispeed - min_ispeed
 
     if ispeed_range == 0:  # All the ispeeds are the same.
-        return "yellow"
-
-    proportion = (ispeed - min_ispeed) / ispeed_range
+        return ["black" if ispeed == 0 else "yellow" for ispeed in ispeeds.tolist()]
 
-    hue = proportion * 160  # 160 is the hue of medium spring green, the color of the fastest ispeed.
+    # The hue is the proportion of the ispeed in the range multiplied by 160, which is the hue of
+    # medium spring green, the color of the fastest ispeed. Both factors are merged in a single one.
+    hue_factor = 160 / ispeed_range
+    hues = numpy.round((ispeeds - min_ispeed) * hue_factor, 2)
 
-    # Return the color in HSL format.
-    return "hsl({},100%,50%)".format(round(hue, 2))
+    # Return the colors in HSL format, or black for the closed roads.
+    return ["black" if ispeed == 0 else hsl_color(hue) for ispeed, hue in zip(ispeeds.tolist(), hues.tolist())]
 
 
-def get_igraph_plot(igraph, size):
+def get_igraph_plot(igraph, size, dynamic_itimes=None):
     """Returns a square StaticMap of the specified size with all the edges of the igraph plotted
     with 2px lines. Each line is painted with an 'icolor' that represents the ispeed of that street
     proportionally to the rest of ispeeds of the igraph. If a road is closed, it is painted black.
-    For further information about how the color is determined, see the icolor function.
+    For further information about how the color is determined, see the icolors function.
+
+    If 'dynamic_itimes' is given (see build_dynamic_itimes), its itimes are used instead of the
+    ones of the igraph for its edges.
 
     Precondition: 'size' is a positive integer that indicates the dimensions in pixels of the map.
     """
-    # Calculate min_ispeed and max_ispeed, which are needed for the icolor function.
-    min_ispeed, max_ispeed = float("inf"), 0
-    for inode1, inode2, edge_data in igraph.edges(data=True):
-        if "length" in edge_data:
-            ispeed = edge_data["length"] / edge_data["itime"]
-            if ispeed != 0:  # min_ispeed and max_ispeed must not be 0.
-                if ispeed < min_ispeed:
-                    min_ispeed = ispeed
-                if ispeed > max_ispeed:
-                    max_ispeed = ispeed
+    # Gather the real edges (the only ones with a 'length' attribute), and compute all their ispeeds
+    # at once with NumPy. The edges with a length of 0 are skipped, as their itime is also 0 (so they
+    # do not have an ispeed) and their lines would not be visible.
+    edges = [(inode1, inode2, edge_data) for inode1, inode2, edge_data in igraph.edges(data=True)
+             if "length" in edge_data and edge_data["itime"] > 0]
+    lengths = numpy.fromiter((edge_data["length"] for _, _, edge_data in edges), dtype=float, count=len(edges))
+    if dynamic_itimes is None:
+        dynamic_itimes = {}
+    itimes = numpy.fromiter((dynamic_itimes.get((inode1, inode2), edge_data["itime"]) for inode1, inode2, edge_data in edges),
+                            dtype=float, count=len(edges))
+    ispeeds = lengths / itimes
+
+    # Calculate min_ispeed and max_ispeed, which are needed for the icolors function. They must not
+    # be 0, so the ispeeds of the closed roads are ignored.
+    open_ispeeds = ispeeds[ispeeds != 0]
+    min_ispeed, max_ispeed = (open_ispeeds.min(), open_ispeeds.max()) if open_ispeeds.size > 0 else (0, 0)
 
     # Create an empty square map of the given size.
-    map = staticmap.StaticMap(size, size)
+    map = CachedTilesStaticMap(size, size)
 
-    # Draw all the edges into the map using 2px lines of the computed icolor.
-    for inode1, inode2, edge_data in igraph.edges(data=True):
-        if "length" in edge_data:
-            ispeed = edge_data["length"] / edge_data["itime"]
-            iline = staticmap.Line([node_to_coordinates(igraph, inode1), node_to_coordinates(igraph, inode2)],
-                                   icolor(ispeed, min_ispeed, max_ispeed), 2)
-            map.add_line(iline)
+    # Draw all the edges into the map using 2px lines of the computed icolors.
+    coordinates = get_coordinates_dictionary(igraph)
+    for (inode1, inode2, edge_data), color in zip(edges, icolors(ispeeds, min_ispeed, max_ispeed)):
+        iline = staticmap.Line([coordinates[inode1], coordinates[inode2]], color, 2)
+        map.add_line(iline)
 
     return map
 
@@ -726,7 +1077,7 @@ def get_ipath_plot(ipath, size):
      - 'size' is a positive integer that indicates the dimensions in pixels of the map.
     """
     # Create an empty square map of the given size.
-    map = staticmap.StaticMap(size, size)
+    map = CachedTilesStaticMap(size, size)
 
     # Draw the line from the source coordinates to the first inode of the path with a 5px Light Blue line.
     start_line = staticmap.Line(ipath[:2], "LightBlue", 5)
@@ -757,7 +1108,7 @@ def get_location_plot(location_coordinates, size):
     Precondition: 'size' is a positive integer that indicates the dimensions in pixels of the map.
     """
     # Create an empty square map of the given size.
-    map = staticmap.StaticMap(size, size)
+    map = CachedTilesStaticMap(size, size)
 
     # Add the marker into the map, centered in the location coordinates.
     location_icon = staticmap.IconMarker(location_coordinates, "icons/source.png", 10, 32)
@@ -780,9 +1131,9 @@ def _test():
     """This function is used to test the module and should not be used by other modules."""
     # Constants.
     PLACE = "Barcelona, Barcelonés, Barcelona, Catalonia"
-    DEFAULT_GRAPH_FILENAME = "graph.dat"
+    DEFAULT_GRAPH_FILENAME = "graph.npz"
     STATIC_IGRAPH_FILENAME = "static_igraph.dat"
-    HIGHWAYS_FILENAME = "highways.dat"
+    HIGHWAYS_FILENAME = "highway_paths.dat"
     SIZE = 1200
     HIGHWAYS_URL = "https://opendata-ajuntament.barcelona.cat/data/dataset/1090983a-1c40-4609-8620-14ad49aae3ab/resource/" \
                    "1d6c814c-70ef-4147-aa16-a49ddb952f72/download/transit_relacio_trams.csv"
@@ -791,60 +1142,73 @@ def _test():
 
     # Load the default graph, or build it if it does not exist and save it for later use.
     if file_exists(DEFAULT_GRAPH_FILENAME):
-        graph = load_data(DEFAULT_GRAPH_FILENAME)
+        graph = load_graph(DEFAULT_GRAPH_FILENAME)
     else:
         graph = build_default_graph(PLACE)
-        save_data(graph, DEFAULT_GRAPH_FILENAME)
+        save_graph(graph, DEFAULT_GRAPH_FILENAME)
 
     print("Default graph loaded!")
 
-    # Load the highway paths, or build them if they do not exist and save them for later use.
-    if file_exists(HIGHWAYS_FILENAME):
-        highway_paths = load_data(HIGHWAYS_FILENAME)
-    else:
+    # Load the highway paths, or build them if they do not exist or were built from another graph and
+    # save them for later use.
+    highway_paths = load_graph_data(graph, HIGHWAYS_FILENAME)
+    if highway_paths is None:
         highways = download_highways(HIGHWAYS_URL)
         highway_paths = build_highway_paths(graph, highways)
-        save_data(highway_paths, HIGHWAYS_FILENAME)
+        save_graph_data(highway_paths, graph, HIGHWAYS_FILENAME)
 
-    # Plot the highways into a PNG image.
-    save_map_as_image(get_highways_plot(graph, highway_paths, SIZE), "highways.png")
+    # The plots are collected in a dictionary from filename to map, and saved as PNG images at the end.
+    plots = {"highways.png": get_highways_plot(graph, highway_paths, SIZE)}
 
-    print("Highway paths loaded and plotted!")
+    print("Highway paths loaded!")
 
-    # Load the static igraph, or build it if it does not exist and save it for later use.
-    if file_exists(STATIC_IGRAPH_FILENAME):
-        igraph = load_data(STATIC_IGRAPH_FILENAME)
-    else:
+    # Load the static igraph, or build it if it does not exist or was built from another graph and
+    # save it for later use. It is pickled instead of saved with save_graph, because its string
+    # inodes make the NumPy arrays slower to load than the pickle.
+    igraph = load_graph_data(graph, STATIC_IGRAPH_FILENAME)
+    if igraph is None:
         igraph = build_static_igraph(graph)
-        save_data(igraph, STATIC_IGRAPH_FILENAME)
+        save_graph_data(igraph, graph, STATIC_IGRAPH_FILENAME)
 
     print("Static igraph loaded!")
 
     # Download congestions (they are downloaded every time because they are updated every 5 minutes).
     congestions = download_congestions(CONGESTIONS_URL)
 
-    # Plot the congestions into a PNG image.
-    save_map_as_image(get_congestions_plot(graph, highway_paths, congestions, SIZE), "congestions.png")
+    # Plot the congestions.
+    plots["congestions.png"] = get_congestions_plot(graph, highway_paths, congestions, SIZE)
 
-    print("Congestion data downloaded and plotted!")
+    print("Congestion data downloaded!")
 
-    # Get the dynamic version of the igraph (taking into account the congestions of the highways).
-    igraph = build_dynamic_igraph(igraph, highway_paths, congestions)
+    # Get the dynamic itimes of the igraph (taking into account the congestions of the highways).
+    dynamic_itimes = build_dynamic_itimes(igraph, highway_paths, congestions)
 
-    # Plot the igraph into a PNG image.
-    save_map_as_image(get_igraph_plot(igraph, SIZE), "igraph.png")
+    # Plot the igraph.
+    plots["igraph.png"] = get_igraph_plot(igraph, SIZE, dynamic_itimes)
 
-    print("Dynamic igraph loaded and plotted!")
+    print("Dynamic itimes computed!")
 
-    # Get the ipath between two addresses.
+    # Get the ipath between two addresses. Both addresses are geocoded concurrently, since each query
+    # is dominated by the latency of the Nominatim API.
     source = "Casa de l'Aigua"
     destination = "Platja de Sant Sebastià"
-    ipath = get_ipath(igraph, name_to_coordinates(source, PLACE), name_to_coordinates(destination, PLACE))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        source_future = executor.submit(name_to_coordinates, source, PLACE)
+        destination_future = executor.submit(name_to_coordinates, destination, PLACE)
+        source_coordinates, destination_coordinates = source_future.result(), destination_future.result()
+    ipath = get_ipath(igraph, source_coordinates, destination_coordinates, dynamic_itimes)
+
+    # Plot the ipath.
+    plots["ipath.png"] = get_ipath_plot(ipath, SIZE)
+
+    print("Path from", source, "to", destination, "found!")
 
-    # Plot the ipath into a PNG image.
-    save_map_as_image(get_ipath_plot(ipath, SIZE), "ipath.png")
+    # Render and save all the plots in parallel, since each rendering is independent. Threads are
+    # used so all the renderings share the tiles cache, and most tiles are downloaded only once.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(plots)) as executor:
+        list(executor.map(save_map_as_image, plots.values(), plots.keys()))
 
-    print("Path from", source, "to", destination, "found and plotted!")
+    print("Highways, congestions, igraph and ipath plotted!")
 
 
 # This is only executed when the file is explicitly executed (with "python3 igo.py").
@@ -16,8 +16,8 @@ import os
 
 
 # Global private module variables.
-_message_ids = {}  # Dictionary from message strings to message IDs.
-_translations = {}  # Dictionary from language code to the translations in this language.
+_translations = {}  # Dictionary from language code to a dictionary from message strings to their translations.
+_available_languages = []  # List of the language codes of the translation files.
 _translations_folder = None
 _base_language_code = None
 
@@ -29,18 +29,19 @@ def build_translation_dictionaries(translations_folder, base_language_code):
     - Precondition: The translations folder must exist and contain at least a file named like the
       base
     """
-    global _translations_folder, _base_language_code
+    global _translations_folder, _base_language_code, _available_languages
     _translations_folder, _base_language_code = translations_folder, base_language_code
 
+    # The folder is listed only once, since the translation files do not change while running.
+    _available_languages = os.listdir(_translations_folder)
+
     with open(_translations_folder + "/" + _base_language_code) as base_language:
-        for line_number, messsage in enumerate(base_language.read().splitlines()):
-            # The ID of each message is its line number.
-            _message_ids[messsage] = line_number
+        base_messages = base_language.read().splitlines()
 
-    for language_code in available_languages():
+    for language_code in _available_languages:
         with open(_translations_folder + "/" + language_code) as lang:
-            # Store all the message strings of the language in a dictionary as a list.
-            _translations[language_code] = lang.read().splitlines()
+            # Relate each message string to its translation, which is found in the same line.
+            _translations[language_code] = dict(zip(base_messages, lang.read().splitlines()))
 
 
 def translate(messsage, language_code):
@@ -57,8 +58,7 @@ def translate(messsage, language_code):
     if language_code == _base_language_code:
         return messsage
     
-    message_id = _message_ids[messsage]
-    return _translations[language_code][message_id]
+    return _translations[language_code][messsage]
 
 
 def available_languages():
@@ -66,4 +66,4 @@ def available_languages():
     
     Precondition: build_translation_dictionaries must have been called before calling this function.
     """
-    return os.listdir(_translations_folder)
+    return _available_languages